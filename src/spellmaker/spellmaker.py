@@ -28,9 +28,61 @@ Note:
 - By default, the class looks for `requirements.txt` in the current directory and 
   writes to `.vscode/dictionaries/data-science-en.txt`.
 - Paths can be overridden when initializing the `SpellMaker` class.
+- Warnings and errors are reported through the `spellmaker.spellmaker` logger.
 
 """
 
+import functools
+import hashlib
+import importlib
+import importlib.util
+import logging
+import os
+import re
+import stat
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Matches the library name in a requirement line in a single anchored scan: the
+# name after an optional "pip install" command, followed by optional extras,
+# version specifier, environment marker and trailing comment, e.g.
+# "numpy==1.19.2", "numpy; python_version < '3.8'" or "pip install black".
+# Blank and comment lines don't match.
+_REQUIREMENT_RE = re.compile(
+    r"\s*(?:(?:python\S*\s+-m\s+)?pip\d*\s+install\s+(?:-\S+\s+)*)?"
+    r"([A-Za-z0-9_.\-]+)(?:\[[^\]]*\])?\s*(?:[=<>!~][^#;]*)?(?:;[^#]*)?(?:#.*)?$"
+)
+
+# Largest number of bytes handed to a single `os.write` call (4 MiB).
+_WRITE_CHUNK_SIZE = 1 << 22
+
+
+def _library_version(library_name):
+    """
+    Return the version that determines the terms of a library.
+
+    Parameters
+    ----------
+    library_name : str
+        The name of the library.
+
+    Returns
+    -------
+    str
+        The installed distribution version, or "python-<major>.<minor>" for
+        modules that don't come from a distribution, like the standard library.
+    """
+    try:
+        return version(library_name)
+    except PackageNotFoundError:
+        return f"python-{sys.version_info.major}.{sys.version_info.minor}"
+
+
 class SpellMaker:
     """
     A utility class to generate custom spell check dictionaries for VS Code's Code Spell Checker.
@@ -48,12 +100,18 @@ class SpellMaker:
     output_path : str
         Path to the output file where the custom dictionary will be saved.
         Defaults to ".vscode/dictionaries/data-science-en.txt".
+    max_workers : int or None
+        Number of workers used to process libraries concurrently.
+        Defaults to None, which picks a size based on `use_processes`.
+    use_processes : bool
+        Whether libraries are processed in worker processes rather than threads.
+        Defaults to False.
 
     Methods
     -------
     get_libraries_from_requirements():
         Extract library names from the specified `requirements.txt` file.
-    process_library(library_name: str) -> list:
+    process_library(library_name: str) -> tuple:
         Extract terms (like function and class names) from a specified library.
     generate_spell_dict() -> list:
         Generate a comprehensive list of terms from all libraries in `requirements.txt`.
@@ -68,7 +126,7 @@ class SpellMaker:
     >>> maker.create_spell_dict()
     """
 
-    def __init__(self, requirements_path="requirements.txt", output_path=".vscode/dictionaries/data-science-en.txt"):
+    def __init__(self, requirements_path="requirements.txt", output_path=".vscode/dictionaries/data-science-en.txt", max_workers=None, use_processes=False):
         """
         Initializes the SpellMaker class with paths for the requirements file and output file.
     
@@ -80,6 +138,21 @@ class SpellMaker:
         output_path : str, optional
             Path to the output file where the custom dictionary will be saved.
             Defaults to ".vscode/dictionaries/data-science-en.txt".
+        max_workers : int, optional
+            Number of workers used to process libraries concurrently. Defaults
+            to None, which uses one thread per library (up to 32) or one process
+            per CPU. Set it to 1 to process the libraries sequentially in the
+            current thread.
+        use_processes : bool, optional
+            Process libraries in a pool of worker processes instead of threads.
+            Importing libraries is mostly I/O-bound, so threads are used by
+            default; processes can help when scanning very large libraries
+            is CPU-bound. Defaults to False.
+    
+        Raises
+        ------
+        ValueError
+            If `max_workers` is given and is smaller than 1.
     
         Attributes
         ----------
@@ -87,22 +160,32 @@ class SpellMaker:
             Path to the `requirements.txt` file for extracting library names.
         output_path : str
             Path to save the generated custom dictionary.
+        max_workers : int or None
+            Number of workers used to process libraries concurrently.
+        use_processes : bool
+            Whether libraries are processed in worker processes rather than threads.
     
         Example
         -------
         >>> maker = SpellMaker(requirements_path="path/to/requirements.txt", output_path="path/to/output.txt")
         """
+        if max_workers is not None and max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}")
         self.requirements_path = requirements_path
         self.output_path = output_path
+        self.max_workers = max_workers
+        self.use_processes = use_processes
 
     def get_libraries_from_requirements(self):
         """
         Extract library names from the specified `requirements.txt` file.
     
-        The function reads the `requirements.txt` file line by line. It ignores 
-        lines starting with "#" as they are considered comments. For each valid 
-        line, it extracts the library name, which is the string before the "=="
-        symbol or the last word in case of commands like "pip install".
+        The function reads the whole `requirements.txt` file at once and then
+        processes it line by line. It ignores lines starting with "#" as they
+        are considered comments. For each valid line, it extracts the library
+        name with a precompiled regular expression: the name before any version
+        specifier such as "==" or ">=" and any environment marker after ";",
+        which also covers commands like "pip install".
     
         Returns
         -------
@@ -135,17 +218,20 @@ class SpellMaker:
         """
         libraries = []
         try:
-            with open(self.requirements_path, "r") as req:
-                for line in req:
-                    line = line.strip()  # Remove leading and trailing whitespaces
-                    if not line.startswith("#") and line:  # Ignore comments and empty lines
-                        library = line.split("==")[0] if "==" in line else line.split(" ")[-1]
-                        libraries.append(library)
+            lines = Path(self.requirements_path).read_text().splitlines()
         except FileNotFoundError:
-            print(f"Error: {self.requirements_path} not found!")
+            logger.error("%s not found!", self.requirements_path)
+            return libraries
+        for line in lines:
+            # Comments and empty lines don't match, so they are ignored
+            match = _REQUIREMENT_RE.match(line)
+            if match:
+                libraries.append(match.group(1))
         return libraries
 
-    def process_library(self, library_name):
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def process_library(library_name):
         """
         Extracts terms (like function and class names) from a specified library.
     
@@ -156,55 +242,60 @@ class SpellMaker:
     
         Returns
         -------
-        list
-            A list containing the library name and other relevant terms 
-            extracted from the library.
+        tuple
+            A tuple containing the library name and other relevant terms 
+            extracted from the library, without duplicates. Private names
+            (those starting with a `_`) are left out.
     
         Notes
         -----
-        If the library is not installed or not found, a warning is printed 
-        and an empty list is returned for that library.
+        If the library is not installed or not found, a warning is logged 
+        and an empty tuple is returned for that library.
+
+        Only the names already defined in the module's namespace are used.
+        Names a module would only create on demand (for example lazily
+        imported submodules) are not imported just to be listed.
+
+        This is a static method so that it can be sent to worker processes
+        by `generate_spell_dict`. Results are cached per library name, so
+        processing the same library again in a process skips both the
+        import and the scan; use `SpellMaker.process_library.cache_clear()`
+        to start over.
         """
-        terms = []
-        try:
-            library = __import__(library_name)
-            terms.append(library_name)
-            all_library_contents = dir(library)
-    
-            new_contents = []
-    
-            # For each item in the library module
-            for item in all_library_contents:
-                try:
-                    # If the item is a class (or a type)
-                    if isinstance(getattr(library, item), type):
-                        # Get all methods in the class
-                        methods = [
-                            method
-                            for method in dir(getattr(library, item))
-                            if not method.startswith("_")
-                        ]
-                        new_contents.extend(methods)
-                except AttributeError:
-                    # Skip if attribute doesn't exist
-                    continue
-    
-            all_library_contents.extend(new_contents)
+        # Modules that are already imported are used as they are; `find_spec`
+        # raises for those without a `__spec__`, such as `__main__`
+        library = sys.modules.get(library_name)
+        if library is None:
+            try:
+                # Names that aren't importable at all are caught without raising
+                if importlib.util.find_spec(library_name) is None:
+                    logger.warning("Unable to import %s. Skipping.", library_name)
+                    return ()
+                library = importlib.import_module(library_name)
+            except (ImportError, ValueError):
+                logger.warning("Unable to import %s. Skipping.", library_name)
+                return ()
     
-            # Remove duplicates from the list
-            all_library_contents = list(set(all_library_contents))
-    
-            # Remove any private attributes or methods (those starting with a `_`)
-            all_library_contents = [
-                term for term in all_library_contents if not term.startswith("_")
-            ]
+        # Read the already-materialized members from the module's namespace, so
+        # descriptors and lazy `__getattr__` hooks are not triggered
+        try:
+            members = dict(vars(library))
+        except TypeError:
+            # Fall back to attribute lookups for objects without a `__dict__`
+            members = {item: getattr(library, item, None) for item in dir(library)}
     
-            terms.extend(all_library_contents)
+        # Collect every name in the library module into one set, built in a
+        # single call, then only visit the members that are classes (or types)
+        # to add all their methods
+        seen = set(members)
+        update = seen.update
+        for obj in members.values():
+            if isinstance(obj, type):
+                update(dir(obj))
+        seen.discard(library_name)
     
-        except ImportError:
-            print(f"Warning: Unable to import {library_name}. Skipping.")
-        
-        return terms
+        # Remove any private attributes or methods (those starting with a `_`)
+        return (library_name,) + tuple(term for term in seen if term[:1] != "_")
 
     def generate_spell_dict(self, output_path=None):
         """
@@ -215,20 +306,23 @@ class SpellMaker:
         ----------
         output_path : str or pathlib.Path, optional
             The path where the generated spell dictionary should be written. 
-            If not provided, it will use a default path `.vscode/dictionaries/data-science-en.txt`.
+            If not provided, it will use the `output_path` given at initialization, which
+            defaults to `.vscode/dictionaries/data-science-en.txt`.
     
         Returns
         -------
         list
-            A comprehensive list of terms extracted from all libraries in the 
-            `requirements.txt` file. The list might contain duplicates which need 
-            to be handled separately.
+            A comprehensive, sorted list of the unique terms extracted from all
+            libraries in the `requirements.txt` file.
     
         Notes
         -----
         - The function relies on the `process_library` method to extract terms from each library.
+          Libraries are independent of each other, so they are processed concurrently in a
+          pool of `max_workers` threads (or processes, with `use_processes`) unless
+          `max_workers` is 1 or there is only one library.
         - Libraries that are not installed or are inaccessible will be skipped, 
-          and a warning will be printed.
+          and a warning will be logged.
         - The function assumes that the `requirements.txt` file path is set by the 
           `requirements_path` attribute of the `SpellMaker` class.
     
@@ -240,23 +334,34 @@ class SpellMaker:
         pandas==1.2.0
         ```
         The function might return a list containing terms like:
-        ['numpy', 'ndarray', 'dot', 'pandas', 'DataFrame', 'read_csv', ...]
+        ['DataFrame', 'dot', 'ndarray', 'numpy', 'pandas', 'read_csv', ...]
     
         """
         libraries = self.get_libraries_from_requirements()
-        all_terms = []
-        for library_name in libraries:
-            terms = self.process_library(library_name)
-            all_terms.extend(terms)
+        # Collect the terms in a set so duplicates across libraries are dropped
+        all_terms = set()
+        if self.max_workers == 1 or len(libraries) < 2:
+            for terms in map(self.process_library, libraries):
+                all_terms.update(terms)
+        elif self.use_processes:
+            # Import and scan the libraries in parallel worker processes
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                for terms in executor.map(self.process_library, libraries):
+                    all_terms.update(terms)
+        else:
+            # Imports spend most of their time reading files, so threads overlap them
+            max_workers = self.max_workers if self.max_workers is not None else min(32, len(libraries))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for terms in executor.map(self.process_library, libraries):
+                    all_terms.update(terms)
+        all_terms = sorted(all_terms)
     
-        # Set a default output path if none is provided
+        # Fall back to the output path given at initialization
         if output_path is None:
-            output_path = ".vscode/dictionaries/data-science-en.txt"
+            output_path = self.output_path
     
         # Write the terms to the output path
-        with open(output_path, "w") as f:
-            for term in all_terms:
-                f.write(term + "\n")
+        self.write_to_file(all_terms, output_path)
     
         return all_terms
 
@@ -276,28 +381,115 @@ class SpellMaker:
         Returns
         -------
         None
+
+        Notes
+        -----
+        The terms are joined and encoded to UTF-8 once, and the resulting bytes
+        are written straight to the file descriptor with `os.write`. Small
+        dictionaries take a single system call; larger ones are written in
+        4 MiB chunks.
+
+        The bytes first go to a uniquely named temporary file next to
+        `output_path`, which is flushed to disk and then replaces it with
+        `os.replace`. An interrupted write, a crash or a concurrent run writing
+        the same dictionary therefore never leaves a partial one behind. The
+        permissions of an existing output file are kept.
         """
-        with open(output_path, "w") as f:
-            for term in terms:
-                f.write(term + "\n")
+        blob = ("\n".join(terms) + "\n").encode("utf-8") if terms else b""
+        view = memoryview(blob)
+        # A unique name, created exclusively, so concurrent runs writing the same
+        # dictionary never share (and truncate) each other's temporary file
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            mode = stat.S_IMODE(os.stat(output_path).st_mode)
+        except FileNotFoundError:
+            mode = None
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+        fd = os.open(tmp_path, flags, 0o666)
+        try:
+            try:
+                if mode is not None:
+                    os.chmod(tmp_path, mode)
+                written = 0
+                while written < len(view):
+                    written += os.write(fd, view[written:written + _WRITE_CHUNK_SIZE])
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
 
-    def create_spell_dict(self, output_path):
+    def _requirements_digest(self):
+        """
+        Hash the `requirements.txt` file together with everything else the terms depend on.
+
+        Besides the `requirements.txt` file, the hash covers the Python version,
+        the `spellmaker` version and the installed version of every listed
+        library.
+
+        Returns
+        -------
+        str or None
+            The hex digest identifying the current requirements and environment,
+            or None if the `requirements.txt` file cannot be read.
+        """
+        try:
+            digest = hashlib.blake2b(Path(self.requirements_path).read_bytes())
+        except OSError:
+            return None
+        # Upgrading Python or spellmaker changes the terms even if requirements.txt doesn't change
+        try:
+            spellmaker_version = version("spellmaker")
+        except PackageNotFoundError:
+            spellmaker_version = ""
+        digest.update(f"\npython=={sys.version}\nspellmaker=={spellmaker_version}\n".encode("utf-8"))
+        # So does upgrading a library
+        for library_name in self.get_libraries_from_requirements():
+            digest.update(f"\n{library_name}=={_library_version(library_name)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def create_spell_dict(self, output_path=None):
         """
         Generates a comprehensive spell dictionary from the libraries listed in the `requirements.txt` file 
         and writes the terms to the specified output file.
 
         Parameters
         ----------
-        output_path : str or Path
+        output_path : str or Path, optional
             The path to the file where the generated spell dictionary will be written.
+            Defaults to the `output_path` given at initialization.
 
         Notes
         -----
-        - This method uses the `generate_spell_dict` to get the terms and then writes them to the file 
+        - This method uses the `generate_spell_dict` to get the terms, which writes them to the file 
           using the `write_to_file` method.
+        - A hash of the `requirements.txt` file, the Python and `spellmaker` versions and the
+          installed library versions is stored next to the output file, in `<output_path>.hash`.
+          If the hash still matches and the output file exists, the dictionary is up to date
+          and nothing is regenerated.
         """
-        terms = self.generate_spell_dict()
-        self.write_to_file(terms, output_path)
+        if output_path is None:
+            output_path = self.output_path
+
+        digest = self._requirements_digest()
+        hash_path = Path(f"{output_path}.hash")
+        if (
+            digest is not None
+            and Path(output_path).exists()
+            and hash_path.exists()
+            and hash_path.read_text() == digest
+        ):
+            logger.info("%s is up to date. Skipping.", output_path)
+            return
+
+        self.generate_spell_dict(output_path=output_path)
+        if digest is not None:
+            hash_path.write_text(digest)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,14 @@
+import importlib
+import importlib.machinery
+import importlib.metadata
+import os
+import stat
+import subprocess
+import sys
+import types
 import pytest
 # tests/test_spellmaker.py
+import spellmaker.spellmaker
 from spellmaker.spellmaker import SpellMaker
 
 @pytest.fixture
@@ -28,6 +37,15 @@ def mock_requirements_file(tmp_path):
     requirements_path.write_text(requirements_content)
     return requirements_path
 
+@pytest.fixture(autouse=True)
+def clear_process_library_cache():
+    """
+    Fixture to clear the `process_library` cache so tests don't share results.
+    """
+    SpellMaker.process_library.cache_clear()
+    yield
+    SpellMaker.process_library.cache_clear()
+
 def test_get_libraries_from_requirements(mock_requirements_file):
     """
     Test if the `get_libraries_from_requirements` method correctly extracts library names
@@ -42,6 +60,29 @@ def test_get_libraries_from_requirements(mock_requirements_file):
     # Assert that the result matches the expected list of libraries
     assert libraries == ['numpy', 'pandas', 'black'], f"Expected ['numpy', 'pandas', 'black'] but got {libraries}"
 
+def test_get_libraries_from_requirements_with_specifiers(tmp_path):
+    """
+    Test if the `get_libraries_from_requirements` method extracts library names
+    from lines with other version specifiers, environment markers and from
+    "pip install" commands.
+    """
+    requirements_path = tmp_path / "requirements.txt"
+    requirements_path.write_text(
+        "scikit-learn>=1.0\n"
+        "matplotlib == 3.7.2  # pinned\n"
+        "pip install seaborn==0.12.2\n"
+        "pip install black\n"
+        'numpy; python_version < "3.8"\n'
+        'pandas ; python_version>="3.8"\n'
+        "scipy>=1.10; sys_platform == 'linux'\n"
+    )
+
+    maker = SpellMaker(requirements_path=requirements_path)
+    libraries = maker.get_libraries_from_requirements()
+
+    expected = ['scikit-learn', 'matplotlib', 'seaborn', 'black', 'numpy', 'pandas', 'scipy']
+    assert libraries == expected, f"Expected {expected} but got {libraries}"
+
 def test_process_library():
     """
     Test if the `process_library` method correctly extracts terms from a known library.
@@ -56,6 +97,81 @@ def test_process_library():
     assert library_name in terms, f"Expected {library_name} in terms but not found"
     assert "sqrt" in terms, "Expected 'sqrt' in terms but not found"  # math.sqrt is a known function
     assert "pi" in terms, "Expected 'pi' in terms but not found"  # math.pi is a known constant
+    assert len(terms) == len(set(terms)), "Expected terms without duplicates"
+
+def test_process_library_is_cached(monkeypatch):
+    """
+    Test if the `process_library` method imports and scans a library only once
+    when it is processed repeatedly.
+    """
+    # Make sure the library isn't imported yet, so the first call has to import it
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    with patch('importlib.import_module', wraps=importlib.import_module) as import_module:
+        first = SpellMaker.process_library("colorsys")
+        second = SpellMaker.process_library("colorsys")
+
+    assert first == second, "Expected repeated calls to return the same terms"
+    import_module.assert_called_once_with("colorsys")
+
+def test_process_library_ignores_lazy_module_attributes(monkeypatch):
+    """
+    Test if the `process_library` method lists only the names defined in a module's
+    namespace, without calling the module's `__getattr__` or `__dir__` hooks.
+    """
+    hook_calls = []
+
+    def lazy_getattr(name):
+        hook_calls.append(name)
+        return type(name, (), {"lazy_method": lambda self: None})
+
+    def lazy_dir():
+        hook_calls.append("__dir__")
+        return ["eager_function", "lazy_submodule"]
+
+    module = types.ModuleType("lazy_library")
+    module.__spec__ = importlib.machinery.ModuleSpec("lazy_library", None)
+    module.eager_function = lambda: None
+    module.__getattr__ = lazy_getattr
+    module.__dir__ = lazy_dir
+    monkeypatch.setitem(sys.modules, "lazy_library", module)
+
+    terms = SpellMaker.process_library("lazy_library")
+
+    assert "eager_function" in terms, "Expected 'eager_function' in terms but not found"
+    assert "lazy_submodule" not in terms, "Expected lazy names to be left out"
+    assert "lazy_method" not in terms, "Expected lazy names to be left out"
+    assert hook_calls == [], f"Expected no lazy hook calls but got {hook_calls}"
+
+def test_process_library_with_module_without_spec(monkeypatch, tmp_path):
+    """
+    Test if the `process_library` method processes an imported module whose
+    `__spec__` is None, and if `generate_spell_dict` keeps the other libraries.
+    """
+    module = types.ModuleType("specless_library")
+    module.__spec__ = None
+    module.specless_function = lambda: None
+    monkeypatch.setitem(sys.modules, "specless_library", module)
+
+    terms = SpellMaker.process_library("specless_library")
+    assert "specless_function" in terms, "Expected 'specless_function' in terms but not found"
+
+    requirements_path = tmp_path / "requirements.txt"
+    requirements_path.write_text("specless_library\nmath\n")
+    maker = SpellMaker(requirements_path=requirements_path)
+    all_terms = maker.generate_spell_dict(output_path=tmp_path / "data-science-en.txt")
+    assert "specless_function" in all_terms and "sqrt" in all_terms
+
+def test_process_library_skips_missing_library(caplog):
+    """
+    Test if the `process_library` method skips a library that cannot be found
+    without trying to import it.
+    """
+    with patch('importlib.import_module') as import_module:
+        terms = SpellMaker.process_library("not_an_installed_library")
+
+    assert terms == (), f"Expected no terms but got {terms}"
+    import_module.assert_not_called()
+    assert "Unable to import not_an_installed_library. Skipping." in caplog.text
 
 from unittest.mock import patch, Mock
 
@@ -64,14 +180,15 @@ def test_generate_spell_dict(mock_requirements_file, tmp_path):
     Test if the `generate_spell_dict` method correctly generates a spell dictionary
     from a mock requirements.txt file and writes the terms to the specified output path.
     """
-    # Initialize the SpellMaker class with the path to the temporary requirements file
-    maker = SpellMaker(requirements_path=mock_requirements_file)
+    # Initialize the SpellMaker class with the path to the temporary requirements file.
+    # Libraries are processed in-process so the mocked import below applies to them.
+    maker = SpellMaker(requirements_path=mock_requirements_file, max_workers=1)
 
     # Define the output path for the generated dictionary
     output_path = tmp_path / "data-science-en.txt"
 
-    # Mock the behavior of the __import__ function to simulate the presence of the libraries
-    with patch('builtins.__import__', Mock()):
+    # Mock the behavior of importlib to simulate the presence of the libraries
+    with patch('importlib.util.find_spec', Mock()), patch('importlib.import_module', Mock()):
         # Call the method to generate the spell dictionary
         terms = maker.generate_spell_dict(output_path=output_path)
 
@@ -80,6 +197,30 @@ def test_generate_spell_dict(mock_requirements_file, tmp_path):
     assert "pandas" in terms, "Expected 'pandas' in terms but not found"
     assert "black" in terms, "Expected 'black' in terms but not found"
 
+def test_generate_spell_dict_with_processes(tmp_path):
+    """
+    Test if the `generate_spell_dict` method returns the same terms when the libraries
+    are processed in worker processes as when they are processed sequentially.
+    """
+    requirements_path = tmp_path / "requirements.txt"
+    requirements_path.write_text("math\njson\n")
+    output_path = tmp_path / "data-science-en.txt"
+
+    sequential = SpellMaker(requirements_path=requirements_path, max_workers=1)
+    processes = SpellMaker(requirements_path=requirements_path, max_workers=2, use_processes=True)
+
+    expected = sequential.generate_spell_dict(output_path=output_path)
+    assert processes.generate_spell_dict(output_path=output_path) == expected
+    assert "sqrt" in expected and "JSONDecoder" in expected
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_init_rejects_invalid_max_workers(use_processes):
+    """
+    Test if `SpellMaker` rejects a `max_workers` value below 1 for both pool types.
+    """
+    with pytest.raises(ValueError, match="max_workers"):
+        SpellMaker(max_workers=0, use_processes=use_processes)
+
 def test_write_to_file(tmp_path):
     """
     Test if the `write_to_file` method correctly writes terms to a specified output path.
@@ -101,7 +242,68 @@ def test_write_to_file(tmp_path):
     # Assert that the written content matches the terms
     assert written_content == terms, f"Expected terms {terms} but got {written_content}"
 
-def test_create_spell_dict(mock_requirements_file, tmp_path, capfd):
+def test_write_to_file_replaces_existing_file(tmp_path):
+    """
+    Test if the `write_to_file` method replaces an existing output file
+    without leaving its temporary file behind.
+    """
+    maker = SpellMaker()
+    output_path = tmp_path / "data-science-en.txt"
+    output_path.write_text("stale\n")
+
+    maker.write_to_file(["numpy", "pandas"], output_path)
+
+    assert output_path.read_text().splitlines() == ["numpy", "pandas"]
+    assert list(tmp_path.iterdir()) == [output_path], "Expected no temporary file to be left behind"
+
+def test_write_to_file_uses_unique_temporary_files(tmp_path):
+    """
+    Test if the `write_to_file` method writes through a temporary file of its own,
+    leaving another writer's temporary file for the same output untouched.
+    """
+    maker = SpellMaker()
+    output_path = tmp_path / "data-science-en.txt"
+    other_tmp_path = tmp_path / "data-science-en.txt.tmp"
+    other_tmp_path.write_text("numpy\npandas\n")
+
+    with patch('os.replace', wraps=os.replace) as replace:
+        maker.write_to_file(["numpy"], output_path)
+        maker.write_to_file(["pandas"], output_path)
+
+    first_tmp_path, second_tmp_path = (call.args[0] for call in replace.call_args_list)
+    assert first_tmp_path != second_tmp_path, "Expected a new temporary file for every write"
+    assert other_tmp_path.read_text() == "numpy\npandas\n", "Expected the other temporary file to be untouched"
+    assert output_path.read_text() == "pandas\n"
+
+def test_write_to_file_keeps_existing_permissions(tmp_path):
+    """
+    Test if the `write_to_file` method keeps the permissions of an existing output file.
+    """
+    maker = SpellMaker()
+    output_path = tmp_path / "data-science-en.txt"
+    output_path.write_text("stale\n")
+    output_path.chmod(0o600)
+
+    maker.write_to_file(["numpy"], output_path)
+
+    assert stat.S_IMODE(output_path.stat().st_mode) == 0o600
+
+def test_write_to_file_keeps_previous_file_on_error(tmp_path):
+    """
+    Test if the `write_to_file` method leaves the previous output file intact and
+    removes its temporary file when writing fails.
+    """
+    maker = SpellMaker()
+    output_path = tmp_path / "data-science-en.txt"
+    output_path.write_text("numpy\n")
+
+    with patch('os.fsync', side_effect=OSError("disk full")), pytest.raises(OSError, match="disk full"):
+        maker.write_to_file(["pandas"], output_path)
+
+    assert output_path.read_text() == "numpy\n"
+    assert list(tmp_path.iterdir()) == [output_path], "Expected no temporary file to be left behind"
+
+def test_create_spell_dict(mock_requirements_file, tmp_path, caplog):
     """
     Test if the `create_spell_dict` method correctly creates a spell dictionary
     from the mock requirements.txt file and writes the terms to the specified output path.
@@ -115,11 +317,122 @@ def test_create_spell_dict(mock_requirements_file, tmp_path, capfd):
     # Call the method to create the spell dictionary and write to the output file
     maker.create_spell_dict(output_path=output_path)
 
-    # Capture the printed output
-    captured = capfd.readouterr()
+    # Assert that the warning messages were logged
+    assert "Unable to import numpy. Skipping." in caplog.text
+    assert "Unable to import pandas. Skipping." in caplog.text
+    assert "Unable to import black. Skipping." in caplog.text
+
+
+def test_generate_spell_dict_deduplicates_terms(mock_requirements_file, tmp_path):
+    """
+    Test if the `generate_spell_dict` method drops terms shared by several libraries
+    and returns the remaining terms sorted.
+    """
+    maker = SpellMaker(requirements_path=mock_requirements_file, max_workers=1)
+    output_path = tmp_path / "data-science-en.txt"
+
+    # Simulate libraries that expose overlapping terms
+    library_terms = {
+        "numpy": ["numpy", "array", "dtype"],
+        "pandas": ["pandas", "array", "DataFrame"],
+        "black": ["black", "dtype"],
+    }
+    with patch.object(SpellMaker, "process_library", side_effect=library_terms.get):
+        terms = maker.generate_spell_dict(output_path=output_path)
+
+    expected = ["DataFrame", "array", "black", "dtype", "numpy", "pandas"]
+    assert terms == expected, f"Expected terms {expected} but got {terms}"
+    assert output_path.read_text().splitlines() == expected
+
+def test_create_spell_dict_skips_up_to_date_output(mock_requirements_file, tmp_path):
+    """
+    Test if the `create_spell_dict` method skips regeneration while the requirements.txt
+    file is unchanged, and regenerates the dictionary once it changes.
+    """
+    maker = SpellMaker(requirements_path=mock_requirements_file, max_workers=1)
+    output_path = tmp_path / "data-science-en.txt"
+
+    with patch.object(SpellMaker, "generate_spell_dict", side_effect=maker.generate_spell_dict) as generate_spell_dict:
+        # First run: no dictionary yet, so it is generated along with its hash
+        maker.create_spell_dict(output_path=output_path)
+        assert output_path.exists()
+        assert (tmp_path / "data-science-en.txt.hash").exists()
+
+        # Unchanged requirements: nothing to do
+        maker.create_spell_dict(output_path=output_path)
+        assert generate_spell_dict.call_count == 1
+
+        # Requirements file changed: regenerate
+        mock_requirements_file.write_text("math\n")
+        maker.create_spell_dict(output_path=output_path)
+        assert generate_spell_dict.call_count == 2
+
+    assert "sqrt" in output_path.read_text().splitlines()
+
+def upgraded_spellmaker_version(distribution_name):
+    """
+    Stand-in for `importlib.metadata.version` that reports a newer `spellmaker`.
+    """
+    if distribution_name == "spellmaker":
+        return "99.0.0"
+    return importlib.metadata.version(distribution_name)
+
+@pytest.mark.parametrize("changed_environment", [
+    patch('sys.version', "0.0.0 (changed)"),
+    patch('spellmaker.spellmaker.version', side_effect=upgraded_spellmaker_version),
+], ids=["python-version", "spellmaker-version"])
+def test_create_spell_dict_rebuilds_after_environment_change(mock_requirements_file, tmp_path, changed_environment):
+    """
+    Test if the `create_spell_dict` method regenerates the dictionary when the Python
+    version or the `spellmaker` version changes, even though the requirements.txt
+    file itself is unchanged.
+    """
+    maker = SpellMaker(requirements_path=mock_requirements_file, max_workers=1)
+    output_path = tmp_path / "data-science-en.txt"
+
+    with patch.object(SpellMaker, "generate_spell_dict", side_effect=maker.generate_spell_dict) as generate_spell_dict:
+        maker.create_spell_dict(output_path=output_path)
+        maker.create_spell_dict(output_path=output_path)
+        assert generate_spell_dict.call_count == 1
+
+        with changed_environment:
+            maker.create_spell_dict(output_path=output_path)
+        assert generate_spell_dict.call_count == 2
+
+def test_main_writes_spell_dict(tmp_path):
+    """
+    Test if running the `spellmaker` module as a script writes the spell dictionary
+    for the requirements.txt file in the current directory to the default output path.
+    """
+    (tmp_path / "requirements.txt").write_text("math\n")
+    (tmp_path / ".vscode" / "dictionaries").mkdir(parents=True)
+
+    result = subprocess.run(
+        [sys.executable, spellmaker.spellmaker.__file__],
+        cwd=tmp_path, capture_output=True, text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    terms = (tmp_path / ".vscode" / "dictionaries" / "data-science-en.txt").read_text().splitlines()
+    assert "math" in terms and "sqrt" in terms
+
+def test_main_skips_up_to_date_spell_dict(tmp_path):
+    """
+    Test if running the `spellmaker` module as a script stores the requirements hash
+    and leaves an up-to-date spell dictionary alone on the next run.
+    """
+    (tmp_path / "requirements.txt").write_text("math\n")
+    dictionaries = tmp_path / ".vscode" / "dictionaries"
+    dictionaries.mkdir(parents=True)
+    output_path = dictionaries / "data-science-en.txt"
+    command = [sys.executable, spellmaker.spellmaker.__file__]
 
-    # Assert that the warning messages were printed
-    assert "Unable to import numpy. Skipping." in captured.out
-    assert "Unable to import pandas. Skipping." in captured.out
-    assert "Unable to import black. Skipping." in captured.out
+    first = subprocess.run(command, cwd=tmp_path, capture_output=True, text=True)
+    assert first.returncode == 0, first.stderr
+    assert (dictionaries / "data-science-en.txt.hash").exists()
 
+    # Backdate the dictionary, so a regeneration would be visible in its mtime
+    os.utime(output_path, (0, 0))
+    second = subprocess.run(command, cwd=tmp_path, capture_output=True, text=True)
+    assert second.returncode == 0, second.stderr
+    assert output_path.stat().st_mtime == 0, "Expected the up-to-date dictionary not to be rewritten"